@@ -1,16 +1,20 @@
 import logging
 import os
-import tempfile
 import asyncio
+import multiprocessing
 import time
+import io
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters, CallbackQueryHandler
-import smtplib
+import aiosmtplib
 from email.mime.text import MIMEText
 import google.generativeai as genai
+from google.api_core import exceptions as gexc
 import fitz
-from PIL import Image
-import io
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -29,10 +33,10 @@ EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 USER_EMAIL = os.getenv("USER_EMAIL")
 
-# Convert AUTHORIZED_USERS string to list of integers
+# Convert AUTHORIZED_USERS string to a set of integers
 AUTHORIZED_USERS_STR = os.getenv("AUTHORIZED_USERS", "")
-AUTHORIZED_USERS = [int(user_id)
-                    for user_id in AUTHORIZED_USERS_STR.split(",") if user_id]
+AUTHORIZED_USERS = frozenset(int(user_id)
+                             for user_id in AUTHORIZED_USERS_STR.split(",") if user_id)
 
 # Updated Gemini models list - using only 2.0 models since 1.5 will be discontinued
 # Models in priority order
@@ -41,6 +45,40 @@ MODEL_USAGE = {model: {"count": 0, "last_used": 0, "errors": 0}
                for model in MODELS}
 current_model_idx = 0
 
+# Errors raised by the Gemini API when a model's rate limit or quota is hit
+RATE_LIMIT_ERRORS = (gexc.ResourceExhausted, gexc.TooManyRequests)
+
+# GenerativeModel instances, built once per model name
+_MODEL_CACHE = {}
+
+# Maximum number of extractions kept per user for the email button
+MAX_STORED_EXTRACTIONS = 20
+
+# Embedded PDF text is used instead of OCR when it is long enough
+# and mostly made of Arabic-script (Persian) characters
+MIN_NATIVE_TEXT_LENGTH = 50
+MIN_NATIVE_PERSIAN_RATIO = 0.3
+
+# Maximum number of Gemini requests in flight across the whole bot
+GEMINI_CONCURRENCY = 3
+# Shared limiter for GEMINI_CONCURRENCY, created lazily on the running event loop
+_GEMINI_LIMITER = {"semaphore": None}
+
+# Gemini request timeout, in seconds per image in the request
+GEMINI_TIMEOUT_PER_IMAGE = 30
+
+# Number of scanned PDF pages sent to Gemini in a single request
+PAGES_PER_REQUEST = 3
+MULTI_PAGE_PROMPT = (
+    "Each image is one page of a document. Extract and transcribe any Persian text in each image. "
+    "For each image, in order, write a line '=== PAGE i ===' (i starting at 1) followed by ONLY "
+    "the Persian text of that page, no explanations. Leave the section empty if a page has no text.")
+PAGE_MARKER_RE = re.compile(r"^=== PAGE (\d+) ===[ \t]*$", re.MULTILINE)
+CODE_FENCE_RE = re.compile(r"^[ \t]*```.*$", re.MULTILINE)
+
+# Worker pool for CPU-bound PDF page rendering, created in main()
+_RENDER_POOL = None
+
 # Configure Gemini API
 genai.configure(api_key=GOOGLE_API_KEY)
 
@@ -50,91 +88,104 @@ def get_current_model():
     return MODELS[current_model_idx]
 
 
-def create_gemini_model():
-    """Create and return a Gemini model with the current configuration."""
-    model_name = get_current_model()
+def create_gemini_model(model_name=None):
+    """Return the cached Gemini model for model_name, defaulting to the current one."""
+    if model_name is None:
+        model_name = get_current_model()
     logger.info(f"Using model: {model_name}")
-    return genai.GenerativeModel(model_name)
+    if model_name not in _MODEL_CACHE:
+        _MODEL_CACHE[model_name] = genai.GenerativeModel(model_name)
+    return _MODEL_CACHE[model_name]
 
 
-async def rotate_model_on_error():
-    """Rotate to the next available model on error."""
+async def rotate_model_on_error(failed_model):
+    """Rotate away from failed_model and return the name of the model to use next."""
     global current_model_idx
-    # Record the error for the current model
-    current_model = get_current_model()
-    MODEL_USAGE[current_model]["errors"] += 1
+    # Record the error for the model that actually failed
+    MODEL_USAGE[failed_model]["errors"] += 1
 
-    # Move to the next model
-    current_model_idx = (current_model_idx + 1) % len(MODELS)
-    logger.warning(f"Rate limit hit. Rotating to model: {get_current_model()}")
+    # Move to the next model, unless a concurrent call has already rotated away from it
+    if get_current_model() == failed_model:
+        current_model_idx = (current_model_idx + 1) % len(MODELS)
+        logger.warning(f"Rate limit hit. Rotating to model: {get_current_model()}")
 
     # Add a small delay before trying the next model
     await asyncio.sleep(2)
-    return create_gemini_model()
+    return get_current_model()
+
+
+def _gemini_semaphore():
+    """Return the bot-wide semaphore limiting concurrent Gemini requests."""
+    # Created lazily so the semaphore belongs to the running event loop
+    if _GEMINI_LIMITER["semaphore"] is None:
+        _GEMINI_LIMITER["semaphore"] = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    return _GEMINI_LIMITER["semaphore"]
 
 
 async def extract_text_with_retry(image_or_prompt, prompt="Extract and transcribe any Persian text in this image. Return ONLY the Persian text, no explanations."):
     """Extract text using the current Gemini model with auto-rotation on rate limits."""
+    # Accept either a single image/prompt or a list of images
+    contents = image_or_prompt if isinstance(
+        image_or_prompt, list) else [image_or_prompt]
     attempts = 0
-    model = create_gemini_model()
+    # Keep the model name with the model so accounting and rotation refer to the model
+    # actually being called, even if another call rotates the global index meanwhile
+    model_name = get_current_model()
+    model = create_gemini_model(model_name)
     max_attempts = 3 * len(MODELS)  # Try each model up to 3 times
     timeout_count = 0
     max_timeouts = 2  # Maximum timeout retries per model
 
     while attempts < max_attempts:
         try:
-            # Track usage for the current model
-            current_model = get_current_model()
-            MODEL_USAGE[current_model]["count"] += 1
-            MODEL_USAGE[current_model]["last_used"] = time.time()
+            # Track usage for the model being called
+            MODEL_USAGE[model_name]["count"] += 1
+            MODEL_USAGE[model_name]["last_used"] = time.time()
 
             # Log model usage
-            logger.info(f"Model usage: {MODEL_USAGE}")
+            logger.debug("Model usage: %s", MODEL_USAGE)
 
             # Set a timeout for the operation using asyncio
             try:
-                # Make the API call - create a future and wrap it with timeout
-                response_future = asyncio.create_task(
-                    asyncio.to_thread(model.generate_content, [
-                                      prompt, image_or_prompt])
-                )
-                # 30-second timeout
-                response = await asyncio.wait_for(response_future, timeout=30)
+                # Make the API call on the SDK's async transport, allowing 30 seconds per image
+                async with _gemini_semaphore():
+                    response = await asyncio.wait_for(
+                        model.generate_content_async([prompt, *contents]),
+                        timeout=GEMINI_TIMEOUT_PER_IMAGE * len(contents))
                 return response
             except asyncio.TimeoutError:
+                # Timeouts count towards the attempt limit so the loop always ends
+                attempts += 1
                 timeout_count += 1
                 logger.warning(
-                    f"Timeout when calling {current_model} (timeout {timeout_count}/{max_timeouts})")
+                    f"Timeout when calling {model_name} (timeout {timeout_count}/{max_timeouts})")
 
                 if timeout_count >= max_timeouts:
                     # Too many timeouts with this model, try the next one
-                    model = await rotate_model_on_error()
+                    model_name = await rotate_model_on_error(model_name)
+                    model = create_gemini_model(model_name)
                     timeout_count = 0
 
                 # Retry with some backoff
                 await asyncio.sleep(2 * timeout_count)
                 continue
 
-        except Exception as e:
-            error_msg = str(e)
+        except RATE_LIMIT_ERRORS as e:
             attempts += 1
-
-            # Handle rate limit errors
-            if "429" in error_msg or "quota" in error_msg:
-                if attempts >= max_attempts:
-                    logger.error(
-                        f"All models exhausted after {attempts} attempts. Error: {error_msg}")
-                    raise Exception(
-                        "All models exhausted. Please try again later.")
-
-                # Rotate to the next model
-                model = await rotate_model_on_error()
-                timeout_count = 0  # Reset timeout counter for new model
-            else:
-                # For non-rate limit errors, log and re-raise
-                logger.error(f"API error (not rate limit): {error_msg}")
+            if attempts >= max_attempts:
+                logger.error(
+                    f"All models exhausted after {attempts} attempts. Error: {e}")
                 raise
 
+            # Rotate to the next model
+            model_name = await rotate_model_on_error(model_name)
+            model = create_gemini_model(model_name)
+            timeout_count = 0  # Reset timeout counter for new model
+        except Exception as e:
+            # For non-rate limit errors, log and re-raise
+            logger.error(f"API error (not rate limit): {e}")
+            raise
+
     raise Exception(f"Failed after {attempts} attempts across all models.")
 
 # Use this function instead of direct Gemini calls
@@ -149,13 +200,78 @@ async def gemini_extract_text(image_or_prompt):
     return response
 
 
+def _render_page(pdf_bytes, page_num, zoom):
+    """Render a single PDF page to JPEG bytes (runs in a worker process)."""
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        page = pdf_document.load_page(page_num)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return pix.tobytes("jpeg", jpg_quality=85)
+    finally:
+        pdf_document.close()
+
+
+def _store_extraction(context, message_id, text):
+    """Store an extraction for the email button, evicting the oldest ones."""
+    extractions = context.user_data.setdefault('extractions', OrderedDict())
+    extractions[message_id] = text
+    while len(extractions) > MAX_STORED_EXTRACTIONS:
+        extractions.popitem(last=False)
+
+
+async def _edit_status(message, text):
+    """Edit a status message, ignoring failures since it is only informational."""
+    try:
+        await message.edit_text(text)
+    except TelegramError as e:
+        logger.warning(f"Could not update status message: {e}")
+
+
+def _is_native_persian_text(text):
+    """Check whether a page's embedded text can be used without OCR."""
+    if len(text) <= MIN_NATIVE_TEXT_LENGTH:
+        return False
+    chars = [c for c in text if not c.isspace()]
+    persian_chars = sum(1 for c in chars if '\u0600' <= c <= '\u06ff')
+    return persian_chars / len(chars) > MIN_NATIVE_PERSIAN_RATIO
+
+
+def _split_page_texts(text, page_count):
+    """Split a multi-page response into per-page texts, or return None if malformed."""
+    parts = PAGE_MARKER_RE.split(CODE_FENCE_RE.sub("", text))
+    numbers = [int(number) for number in parts[1::2]]
+    # Every page must be marked exactly once, in order
+    if numbers != list(range(1, page_count + 1)):
+        return None
+    return [page_text.strip() for page_text in parts[2::2]]
+
+
+async def extract_pages_text(images):
+    """Extract the text of several page images with a single Gemini request."""
+    if len(images) == 1:
+        response = await extract_text_with_retry(images[0])
+        return [response.text.strip()]
+
+    response = await extract_text_with_retry(images, MULTI_PAGE_PROMPT)
+    texts = _split_page_texts(response.text, len(images))
+    if texts is not None:
+        return texts
+
+    # Fall back to one request per page if the pages could not be told apart
+    logger.warning("Could not split multi-page response, retrying page by page")
+    texts = []
+    for image in images:
+        try:
+            response = await extract_text_with_retry(image)
+            texts.append(response.text.strip())
+        except Exception as e:
+            # Keep the error for this page only so the other pages keep their text
+            texts.append(e)
+    return texts
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
-    user_id = update.effective_user.id
-    if user_id not in AUTHORIZED_USERS:
-        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
-        return
-
     await update.message.reply_text(
         "Welcome to the Persian OCR Bot! Send me images or PDFs containing Persian text, "
         "and I'll extract the text for you.\n"
@@ -165,10 +281,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
-    user_id = update.effective_user.id
-    if user_id not in AUTHORIZED_USERS:
-        return
-
     await update.message.reply_text(
         "Send me an image or PDF containing Persian text and I'll extract it.\n"
         "Commands:\n"
@@ -177,22 +289,71 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "After each extraction, you'll see a button to send the result to your email."
     )
 
+# Cached SMTP connection, reused between emails until it goes idle
+SMTP_IDLE_TIMEOUT = 60  # seconds
+_SMTP_CACHE = {"conn": None, "expires": 0, "lock": None}
+
+
+async def _close_smtp():
+    """Close and forget the cached SMTP connection."""
+    conn = _SMTP_CACHE["conn"]
+    _SMTP_CACHE["conn"] = None
+    if conn is not None and conn.is_connected:
+        try:
+            await conn.quit()
+        except Exception:
+            conn.close()
+
+
+async def _get_smtp():
+    """Return a logged-in SMTP connection, reconnecting if it is stale."""
+    conn = _SMTP_CACHE["conn"]
+    if conn is not None and conn.is_connected and time.time() < _SMTP_CACHE["expires"]:
+        try:
+            if (await conn.noop()).code == 250:
+                return conn
+        except aiosmtplib.SMTPException:
+            pass
+    await _close_smtp()
+
+    conn = aiosmtplib.SMTP(hostname='smtp.gmail.com', port=465, use_tls=True)
+    await conn.connect()
+    try:
+        await conn.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+    except Exception:
+        # Don't leak the freshly opened connection when login fails
+        conn.close()
+        raise
+    _SMTP_CACHE["conn"] = conn
+    return conn
+
 # Function to send email
 
 
-def send_email(to_email, subject, body):
+async def send_email(to_email, subject, body):
     msg = MIMEText(body)
     msg['Subject'] = subject
     msg['From'] = EMAIL_ADDRESS
     msg['To'] = to_email
 
+    # Created lazily so the lock belongs to the running event loop
+    if _SMTP_CACHE["lock"] is None:
+        _SMTP_CACHE["lock"] = asyncio.Lock()
+
     try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ADDRESS, to_email, msg.as_string())
+        async with _SMTP_CACHE["lock"]:
+            try:
+                server = await _get_smtp()
+                await server.send_message(msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                # The server dropped the cached connection, retry once on a fresh one
+                await _close_smtp()
+                server = await _get_smtp()
+                await server.send_message(msg)
+            _SMTP_CACHE["expires"] = time.time() + SMTP_IDLE_TIMEOUT
         logger.info("Email sent successfully!")
         return True
-    except smtplib.SMTPAuthenticationError:
+    except aiosmtplib.SMTPAuthenticationError:
         logger.error(
             "Authentication error. Please check your email and password.")
         return False
@@ -217,7 +378,7 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
             extracted_text = context.user_data['extractions'][message_id]
 
             # Send email
-            if send_email(USER_EMAIL, "Extracted Persian Text", extracted_text):
+            if await send_email(USER_EMAIL, "Extracted Persian Text", extracted_text):
                 # Remove the button
                 await query.edit_message_reply_markup(None)
                 await query.message.reply_text(f"✅ Text sent to {USER_EMAIL}")
@@ -229,33 +390,32 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
 
 async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process photos for Persian OCR."""
-    user_id = update.effective_user.id
-    if user_id not in AUTHORIZED_USERS:
-        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
-        return
-
     # Get the largest photo
     photo = update.message.photo[-1]
 
-    # Inform the user
-    processing_message = await update.message.reply_text("Processing your image...")
+    # Inform the user while the photo is being downloaded
+    processing_task = asyncio.create_task(
+        update.message.reply_text("Processing your image..."))
 
     try:
-        # Get the file and save it
+        # Get the file and download it
         photo_file = await context.bot.get_file(photo.file_id)
-        photo_data = await photo_file.download_as_bytearray()
-
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(photo_data))
+        photo_data, processing_message = await asyncio.gather(
+            photo_file.download_as_bytearray(), processing_task)
 
         # Extract text using Gemini with retry and model rotation
-        await update.message.reply_text(f"Extracting Persian text with Gemini {get_current_model()}...")
+        await _edit_status(processing_message, f"Extracting Persian text with Gemini {get_current_model()}...")
         try:
-            response = await extract_text_with_retry(image)
+            # Telegram always delivers photos as JPEG
+            response = await extract_text_with_retry(
+                {"mime_type": "image/jpeg", "data": bytes(photo_data)})
             extracted_text = response.text
         except Exception as e:
             await update.message.reply_text(f"⚠️ API Error: {str(e)}")
-            await update.message.reply_text("Try again in a few minutes or contact the administrator.")
+            if isinstance(e, RATE_LIMIT_ERRORS):
+                await update.message.reply_text("⚠️ Rate limit exceeded. Please try again later.")
+            else:
+                await update.message.reply_text("Try again in a few minutes or contact the administrator.")
             return
 
         # Send the extracted text
@@ -265,12 +425,8 @@ async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # Create a unique ID for this extraction
         message_id = f"img_{result_message.message_id}"
 
-        # Initialize extractions dict if it doesn't exist
-        if 'extractions' not in context.user_data:
-            context.user_data['extractions'] = {}
-
         # Store the extraction for later use
-        context.user_data['extractions'][message_id] = extracted_text
+        _store_extraction(context, message_id, extracted_text)
 
         # Create keyboard with email button
         keyboard = [
@@ -285,20 +441,14 @@ async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         await update.message.reply_text(f"Error processing image: {str(e)}")
-        if "429" in str(e):
-            await update.message.reply_text("⚠️ Rate limit exceeded. Please try again later.")
 
     # Delete processing message
+    processing_message = await processing_task
     await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=processing_message.message_id)
 
 
 async def process_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Process PDF documents for Persian OCR."""
-    user_id = update.effective_user.id
-    if user_id not in AUTHORIZED_USERS:
-        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
-        return
-
     document = update.message.document
     file_name = document.file_name
 
@@ -306,94 +456,111 @@ async def process_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text("Please send a PDF document.")
         return
 
-    # Inform the user
-    processing_message = await update.message.reply_text("Processing your PDF...")
+    # Inform the user while the PDF is being downloaded
+    processing_task = asyncio.create_task(
+        update.message.reply_text("Processing your PDF..."))
 
     try:
-        # Get the file and save it temporarily
+        # Get the file and download it
         doc_file = await context.bot.get_file(document.file_id)
-        doc_bytes = await doc_file.download_as_bytearray()
+        buf = io.BytesIO()
+        _, processing_message = await asyncio.gather(
+            doc_file.download_to_memory(buf), processing_task)
+        pdf_bytes = buf.getvalue()
 
-        # Create a temporary file for the PDF
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(doc_bytes)
-            pdf_path = temp_file.name
+        # Open the PDF with PyMuPDF directly from memory
+        await _edit_status(processing_message, f"Opening PDF... ({file_name})")
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
 
-        # Open the PDF with PyMuPDF
-        await update.message.reply_text(f"Opening PDF... ({file_name})")
-        pdf_document = fitz.open(pdf_path)
-
-        all_text = ""
+        text_parts = []
         page_count = len(pdf_document)
 
-        await update.message.reply_text(f"Found {page_count} pages. Processing...")
-
         # Process up to the first 5 pages
         max_pages = min(page_count, 5)
-        for page_num in range(max_pages):
-            await update.message.reply_text(f"Processing page {page_num + 1}/{max_pages}...")
-
-            # Get page and render to image
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap(matrix=fitz.Matrix(
-                2.0, 2.0))  # 2x zoom for better OCR
-
-            # Convert to PIL Image
-            img_data = pix.tobytes("png")
-            image = Image.open(io.BytesIO(img_data))
+        await _edit_status(
+            processing_message, f"Found {page_count} pages. Processing {max_pages}...")
+        pages_done = 0
+        results = [None] * max_pages
 
-            # Add delay between pages to avoid rate limiting
-            if page_num > 0:
-                await update.message.reply_text("Waiting a moment to avoid rate limits...")
-                await asyncio.sleep(3)  # Wait 3 seconds between pages
+        # Use the embedded text layer directly when it already holds Persian text
+        scanned_pages = []
+        for page_num in range(max_pages):
+            native_text = pdf_document.load_page(page_num).get_text("text").strip()
+            if _is_native_persian_text(native_text):
+                results[page_num] = native_text
+                pages_done += 1
+            else:
+                scanned_pages.append(page_num)
 
-            # Extract text using Gemini with retry and model rotation
+        async def ocr_pages(page_nums):
+            nonlocal pages_done
             try:
-                response = await extract_text_with_retry(image)
-                page_text = response.text.strip()
+                # Render the pages in the worker pool (2x zoom for better OCR)
+                loop = asyncio.get_running_loop()
+                images = await asyncio.gather(*(
+                    loop.run_in_executor(_RENDER_POOL, _render_page, pdf_bytes, page_num, 2.0)
+                    for page_num in page_nums))
+
+                # Extract text using Gemini with retry and model rotation
+                texts = await extract_pages_text(
+                    [{"mime_type": "image/jpeg", "data": img_data} for img_data in images])
+                for page_num, page_text in zip(page_nums, texts):
+                    results[page_num] = page_text
             except Exception as e:
-                await update.message.reply_text(f"⚠️ API Error on page {page_num + 1}: {str(e)}")
-                all_text += f"\n--- Page {page_num + 1}: Error processing - {str(e)} ---\n"
+                for page_num in page_nums:
+                    results[page_num] = e
+            finally:
+                # Update the single status message instead of sending a new one
+                pages_done += len(page_nums)
+                await _edit_status(
+                    processing_message, f"Processed {pages_done}/{max_pages} pages...")
+
+        # Send scanned pages to Gemini in batches of several pages per request
+        await asyncio.gather(*(
+            ocr_pages(scanned_pages[i:i + PAGES_PER_REQUEST])
+            for i in range(0, len(scanned_pages), PAGES_PER_REQUEST)))
+
+        rate_limited = False
+        for page_num, page_text in enumerate(results):
+            if isinstance(page_text, Exception):
+                rate_limited = rate_limited or isinstance(page_text, RATE_LIMIT_ERRORS)
+                await update.message.reply_text(f"⚠️ API Error on page {page_num + 1}: {str(page_text)}")
+                text_parts.append(f"\n--- Page {page_num + 1}: Error processing - {str(page_text)} ---\n")
                 continue
 
             # Add page text to total text
             if page_text:
-                all_text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                await update.message.reply_text(f"Page {page_num + 1} text extracted")
+                text_parts.append(f"\n--- Page {page_num + 1} ---\n{page_text}\n")
             else:
-                all_text += f"\n--- Page {page_num + 1}: No text detected ---\n"
-                await update.message.reply_text(f"No text found on page {page_num + 1}")
+                text_parts.append(f"\n--- Page {page_num + 1}: No text detected ---\n")
+
+        if rate_limited:
+            await update.message.reply_text("⚠️ Rate limit exceeded. Please try again later.")
+
+        all_text = "".join(text_parts)
 
         # Close the PDF
         pdf_document.close()
 
-        # Delete temporary file
-        os.unlink(pdf_path)
-
         # Send the complete extracted text
         if all_text.strip():
             await update.message.reply_text("✅ Extracted Persian Text from PDF:")
 
-            # Split text into chunks if it's too long
-            chunks = [all_text[i:i+4000]
-                      for i in range(0, len(all_text), 4000)]
-
             complete_text = all_text  # Store complete text for email
 
-            for i, chunk in enumerate(chunks):
-                result_message = await update.message.reply_text(f"{chunk}")
-                if i < len(chunks) - 1:
-                    await update.message.reply_text("(continued...)")
+            # Send long results as a single text file instead of many messages
+            if len(all_text) <= 4000:
+                result_message = await update.message.reply_text(all_text)
+            else:
+                result_message = await update.message.reply_document(
+                    document=io.BytesIO(all_text.encode("utf-8")),
+                    filename=f"{file_name[:-4]}_persian.txt")
 
             # Create a unique ID for this extraction
             message_id = f"pdf_{result_message.message_id}"
 
-            # Initialize extractions dict if it doesn't exist
-            if 'extractions' not in context.user_data:
-                context.user_data['extractions'] = {}
-
             # Store the extraction for later use
-            context.user_data['extractions'][message_id] = complete_text
+            _store_extraction(context, message_id, complete_text)
 
             # Create keyboard with email button
             keyboard = [
@@ -410,32 +577,45 @@ async def process_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         await update.message.reply_text(f"Error processing PDF: {str(e)}")
-        if "429" in str(e):
-            await update.message.reply_text("⚠️ Rate limit exceeded. Please try again later.")
 
     # Delete processing message
+    processing_message = await processing_task
     await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=processing_message.message_id)
 
 
 def main() -> None:
     """Start the bot."""
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    global _RENDER_POOL
+    # Spawn render workers rather than forking a process that already runs gRPC and PTB threads
+    _RENDER_POOL = ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, 4),
+        mp_context=multiprocessing.get_context("spawn"))
+
+    # Create the Application, handling updates from different chats concurrently
+    application = Application.builder().token(
+        TELEGRAM_TOKEN).concurrent_updates(True).build()
+
+    # Only dispatch updates from authorized users
+    authorized = filters.User(user_id=AUTHORIZED_USERS)
 
     # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("start", start, filters=authorized))
+    application.add_handler(CommandHandler("help", help_command, filters=authorized))
 
     # Add callback query handler for the inline buttons
     application.add_handler(CallbackQueryHandler(handle_button_callback))
 
     # Add message handlers
-    application.add_handler(MessageHandler(filters.PHOTO, process_image))
     application.add_handler(MessageHandler(
-        filters.Document.PDF, process_document))
+        filters.PHOTO & authorized, process_image))
+    application.add_handler(MessageHandler(
+        filters.Document.PDF & authorized, process_document))
 
     # Run the bot
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        _RENDER_POOL.shutdown()
 
 
 if __name__ == "__main__":